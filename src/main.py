@@ -1,14 +1,36 @@
 #!/usr/bin/env python3
+import contextlib
+import functools
 import logging
+import os
+import random
+import sys
 import util
 import yao
 from abc import ABC, abstractmethod
-from binary_adder import *
-from n_bit_binary_adder import add_n_bits
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from n_bit_binary_adder import add_n_bits_sliced
 
 logging.basicConfig(format="[%(levelname)s] %(message)s",
                     level=logging.WARNING)
 
+# Circuits with fewer test vectors are evaluated without worker processes
+MIN_PARALLEL_VECTORS = 256
+# Maximum number of test vectors evaluated at once, in process or by a worker
+MAX_CHUNK_VECTORS = 1024
+
+
+# A circuit along with its garbled version, keys and p-bits
+CircuitEntry = namedtuple("CircuitEntry", [
+    "circuit",
+    "garbled_circuit",
+    "garbled_tables",
+    "keys",
+    "pbits",
+    "pbits_out",
+])
+
 
 # Taken from https://github.com/ojroques/garbled-circuit
 class YaoGarbler(ABC):
@@ -22,15 +44,15 @@ class YaoGarbler(ABC):
         for circuit in circuits["circuits"]:
             garbled_circuit = yao.GarbledCircuit(circuit)
             pbits = garbled_circuit.get_pbits()
-            entry = {
-                "circuit": circuit,
-                "garbled_circuit": garbled_circuit,
-                "garbled_tables": garbled_circuit.get_garbled_tables(),
-                "keys": garbled_circuit.get_keys(),
-                "pbits": pbits,
-                "pbits_out": {w: pbits[w]
-                              for w in circuit["out"]},
-            }
+            entry = CircuitEntry(
+                circuit=circuit,
+                garbled_circuit=garbled_circuit,
+                garbled_tables=garbled_circuit.get_garbled_tables(),
+                keys=garbled_circuit.get_keys(),
+                pbits=pbits,
+                pbits_out={w: pbits[w]
+                           for w in circuit["out"]},
+            )
             self.circuits.append(entry)
 
     @abstractmethod
@@ -48,11 +70,22 @@ class LocalTest(YaoGarbler):
         circuits: the JSON file containing circuits
         print_mode: Print a clear version of the garbled tables or
             the circuit evaluation (the default).
+        samples: Optional; number of test vectors to evaluate for each
+            circuit. All the possible inputs are evaluated if None.
+        jobs: Optional; number of worker processes evaluating the test
+            vectors. Defaults to the number of CPUs. Circuits with fewer
+            than MIN_PARALLEL_VECTORS test vectors are evaluated in process.
+        verbose: Print the evaluation of every test vector instead of
+            the mismatching ones only.
     """
 
-    def __init__(self, circuits, print_mode="circuit"):
+    def __init__(self, circuits, print_mode="circuit", samples=None,
+                 jobs=None, verbose=False):
         super().__init__(circuits)
         self._print_mode = print_mode
+        self.samples = samples
+        self.jobs = jobs
+        self.verbose = verbose
         self.modes = {
             "circuit": self._print_evaluation,
         }
@@ -66,79 +99,115 @@ class LocalTest(YaoGarbler):
     def _print_evaluation(self, entry):
         """
         Print circuit evaluation and perform equality check of the result.
+
+        Unless verbose is set, only a summary and the first mismatching
+        test vectors are printed.
         """
-        circuit, pbits, keys = entry["circuit"], entry["pbits"], entry["keys"]
-        garbled_tables = entry["garbled_tables"]
+        circuit, pbits, keys = entry.circuit, entry.pbits, entry.keys
+        garbled_tables = entry.garbled_tables
         outputs = circuit["out"]
 
         # Alice
         a_wires = circuit.get("alice", [])  # Alice's wires
-        a_inputs = {}  # map from Alice's wires to (key, encr_bit) inputs
         print(f'Alice\'s wires {a_wires[::-1]}')
 
         # Bob
         b_wires = circuit.get("bob", [])  # Bob's wires
-        b_inputs = {}  # map from Bob's wires to (key, encr_bit) inputs
         print(f'Bob\'s wires {b_wires[::-1]}\n')
 
-        pbits_out = {w: pbits[w] for w in outputs}  # p-bits of outputs
         total_wires = len(a_wires) + len(b_wires)
         print(f'Total wires: {total_wires}')
 
-        possible_bit_combinations = [
-            format(n, 'b').zfill(total_wires) for n in range(2 ** total_wires)]
+        test_vectors = _test_vectors(len(a_wires), len(b_wires), self.samples)
+
+        # Mask selecting Bob's bits of a test vector
+        b_mask = (1 << len(b_wires)) - 1
+
+        # This operation is necessary because the result of
+        # add_n_bits will have the following shape:
+        # R_3, R_2, R_1, R_0, C_3
+        #
+        # While the outputs variable has the following shape:
+        # R_0, R_1, R_2, R_3, C_3
+        #
+        # Therefore the displayed wires order needs to be modified accordingly.
+        output_wires = outputs[::-1][1:]
+        output_wires.append(outputs[-1])
+
+        # Bit strings of every value of each party's inputs, looked up
+        # when printing instead of being formatted line by line. Only the
+        # verbose mode prints enough lines to pay for the tables
+        if self.verbose:
+            a_strs = _bit_strings(len(a_wires), len(test_vectors))
+            b_strs = _bit_strings(len(b_wires), len(test_vectors))
+        else:
+            a_strs = _BitStrings(len(a_wires))
+            b_strs = _BitStrings(len(b_wires))
+
+        def format_evaluation(n, mpc_result, non_mpc_result, equal):
+            str_bits_a = a_strs[n >> len(b_wires)]
+            str_bits_b = b_strs[n & b_mask]
+
+            return (f"Alice{a_wires[::-1]} = {str_bits_a} - "
+                    f"Bob{b_wires[::-1]} = {str_bits_b}  ->  "
+                    f"Outputs{output_wires} = {mpc_result}  -  "
+                    f"Correct result = {non_mpc_result} - "
+                    f"Are they equal? {'Yes' if equal else 'No'}")
+
+        # Test vectors whose MPC and non-MPC results differ
+        mismatches = []
+        # Output lines not written yet in verbose mode
+        lines = []
 
         print(f"======== {circuit['id']} ========")
 
-        # Generate all possible inputs for both Alice and Bob
-        for bits in possible_bit_combinations:
-            bits_a = [int(b) for b in bits[:len(a_wires)]]  # Alice's inputs
-            bits_b = [int(b) for b in bits[total_wires -
-                                           len(b_wires):]]  # Bob's inputs
-
-            # Excluding carry
-            bits_per_party = len(bits_b)
-
-            # Map Alice's wires to (key, encr_bit)
-            for i in range(len(a_wires)):
-                a_inputs[a_wires[i]] = (keys[a_wires[i]][bits_a[i]],
-                                        pbits[a_wires[i]] ^ bits_a[i])
-
-            # Map Bob's wires to (key, encr_bit)
-            for i in range(len(b_wires)):
-                b_inputs[b_wires[i]] = (keys[b_wires[i]][bits_b[i]],
-                                        pbits[b_wires[i]] ^ bits_b[i])
-
-            result = yao.evaluate(circuit, garbled_tables, pbits_out, a_inputs,
-                                  b_inputs)
-
-            # Format output
-            str_bits_a = ''.join(bits[:len(a_wires)])
-            str_bits_b = ''.join(bits[len(a_wires):])
-            mpc_result = ''.join([str(result[w]) for w in outputs])
-
-            # === Performing the non-MPC function evaluation ===
-            non_mpc_result = add_n_bits(
-                bits_a, bits_b, bits_per_party=bits_per_party)
-
-            # This operation is necessary because the result of
-            # add_n_bits will have the following shape:
-            # R_3, R_2, R_1, R_0, C_3
-            #
-            # While the outputs variable has the following shape:
-            # R_0, R_1, R_2, R_3, C_3
-            #
-            # Therefore the displayed wires order needs to be modified accordingly.
-            output_wires = outputs[::-1][1:]
-            output_wires.append(outputs[-1])
-
-            print(outputs)
-
-            print(f"Alice{a_wires[::-1]} = {str_bits_a} - "
-                  f"Bob{b_wires[::-1]} = {str_bits_b}  ->  "
-                  f"Outputs{output_wires} = {mpc_result}  -  "
-                  f"Correct result = {non_mpc_result} - "
-                  f"Are they equal? {'Yes' if verifyResults(mpc_result, non_mpc_result) else 'No'}")
+        jobs = (os.cpu_count() or 1) if self.jobs is None else self.jobs
+        state = (circuit, garbled_tables, keys, pbits)
+
+        # Split the test vectors in chunks, bounded so that the results are
+        # checked and written while the following chunks are evaluated
+        chunk_size = max(1, min(MAX_CHUNK_VECTORS,
+                                len(test_vectors) // (jobs * 8)))
+        chunks = [test_vectors[i:i + chunk_size]
+                  for i in range(0, len(test_vectors), chunk_size)]
+
+        with contextlib.ExitStack() as stack:
+            if jobs > 1 and len(test_vectors) >= MIN_PARALLEL_VECTORS:
+                # The circuit is sent once to each worker
+                executor = stack.enter_context(ProcessPoolExecutor(
+                    max_workers=jobs,
+                    initializer=_init_worker,
+                    initargs=state))
+                # Results are yielded in the same order as the test vectors
+                chunk_results = executor.map(_evaluate_chunk, chunks)
+            else:
+                # Too few test vectors to pay for starting worker processes
+                evaluate = functools.partial(_evaluate_vectors, *state)
+                chunk_results = map(evaluate, chunks)
+
+            for chunk_result in chunk_results:
+                for n, mpc_result, non_mpc_result in chunk_result:
+                    equal = verifyResults(mpc_result, non_mpc_result)
+                    if self.verbose:
+                        lines.append(f"{outputs}\n")
+                        lines.append(format_evaluation(
+                            n, mpc_result, non_mpc_result, equal) + "\n")
+                    elif not equal:
+                        mismatches.append((n, mpc_result, non_mpc_result))
+
+                    # Write the evaluations in batches, not line by line
+                    if len(lines) >= 4096:
+                        sys.stdout.write(''.join(lines))
+                        lines.clear()
+
+        sys.stdout.write(''.join(lines))
+
+        if not self.verbose:
+            print(f"{'FAILED' if mismatches else 'OK'}: "
+                  f"{len(test_vectors)}/{1 << total_wires} vectors, "
+                  f"{len(mismatches)} mismatches")
+            for n, mpc_result, non_mpc_result in mismatches[:10]:
+                print(format_evaluation(n, mpc_result, non_mpc_result, False))
 
     @property
     def print_mode(self):
@@ -153,6 +222,157 @@ class LocalTest(YaoGarbler):
         self._print_mode = print_mode
 
 
+# Circuit, garbled tables, keys and p-bits evaluated by a worker process
+_worker_state = None
+
+
+def _init_worker(circuit, garbled_tables, keys, pbits):
+    """Store the circuit evaluated by the current worker process."""
+    global _worker_state
+    _worker_state = (circuit, garbled_tables, keys, pbits)
+
+
+def _evaluate_chunk(test_vectors):
+    """Evaluate test vectors on the circuit of the current worker process."""
+    return _evaluate_vectors(*_worker_state, test_vectors)
+
+
+def _evaluate_vectors(circuit, garbled_tables, keys, pbits, test_vectors):
+    """
+    Evaluate the garbled circuit and the non-MPC adder on the given test
+    vectors (see _test_vectors).
+
+    Returns:
+        A list of (test vector, MPC result, non-MPC result) tuples.
+    """
+    outputs = tuple(circuit["out"])
+    pbits_out = {w: pbits[w] for w in outputs}  # p-bits of outputs
+
+    a_wires = circuit.get("alice", [])  # Alice's wires
+    b_wires = circuit.get("bob", [])  # Bob's wires
+
+    # Excluding carry
+    bits_per_party = len(b_wires)
+
+    # Mask selecting Bob's bits of a test vector
+    b_mask = (1 << len(b_wires)) - 1
+
+    # Keys and p-bits of the input wires don't depend on the inputs
+    in_wires = a_wires + b_wires
+    in_key_pairs = [keys[w] for w in in_wires]
+    in_pbits = [pbits[w] for w in in_wires]
+
+    # Map from the input wires to [key, encr_bit] inputs, whose entries are
+    # updated in place by each test vector instead of allocating new pairs
+    in_entries = [[None, 0] for _ in in_wires]
+    wire_inputs = dict(zip(in_wires, in_entries))
+
+    # Maps from the values of each party's inputs to their bits. Many test
+    # vectors share the inputs of a party, so their bits are extracted once
+    a_rows, b_rows = {}, {}
+
+    mpc_results = []
+    alice_inputs, bob_inputs = [], []
+    for n in test_vectors:
+        bits_a_int = n >> len(b_wires)
+        bits_b_int = n & b_mask
+
+        bits_a = a_rows.get(bits_a_int)  # Alice's inputs
+        if bits_a is None:
+            bits_a = a_rows[bits_a_int] = _bits(bits_a_int, len(a_wires))
+        bits_b = b_rows.get(bits_b_int)  # Bob's inputs
+        if bits_b is None:
+            bits_b = b_rows[bits_b_int] = _bits(bits_b_int, len(b_wires))
+
+        # Select the key and encrypted bit of each input wire
+        for i, bit in enumerate(bits_a + bits_b):
+            in_entry = in_entries[i]
+            in_entry[0] = in_key_pairs[i][bit]
+            in_entry[1] = in_pbits[i] ^ bit
+
+        result = yao.evaluate_wires(circuit, garbled_tables, pbits_out,
+                                    wire_inputs)
+
+        # Format output
+        # Output bits are 0 or 1, so 48 + bit is the ASCII code of the digit
+        mpc_result = bytes([48 + result[w] for w in outputs]).decode('ascii')
+
+        mpc_results.append(mpc_result)
+        alice_inputs.append(bits_a)
+        bob_inputs.append(bits_b)
+
+    # === Performing the non-MPC function evaluation ===
+    # All the test vectors of the chunk are added at once
+    non_mpc_results = add_n_bits_sliced(alice_inputs, bob_inputs,
+                                        bits_per_party=bits_per_party)
+
+    return list(zip(test_vectors, mpc_results, non_mpc_results))
+
+
+def _bits(value, width):
+    """
+    Return the width bits of value as a tuple, the i-th bit being stored
+    at position width-1-i.
+    """
+    return tuple((value >> (width - 1 - i)) & 1 for i in range(width))
+
+
+def _bit_strings(width, count):
+    """
+    Return a sequence mapping each value of width bits to its zero-padded
+    bit string. Strings are precomputed only if there are at most count of
+    them and width is at most 20, otherwise they are formatted on access.
+    """
+    if width <= 20 and 1 << width <= count:
+        return [f'{value:0{width}b}' for value in range(1 << width)]
+
+    return _BitStrings(width)
+
+
+class _BitStrings:
+    """Zero-padded bit strings of width bits, formatted on access."""
+
+    def __init__(self, width):
+        self.width = width
+
+    def __getitem__(self, value):
+        return f'{value:0{self.width}b}'
+
+
+def _test_vectors(a_len, b_len, samples=None):
+    """
+    Return the inputs to evaluate, each one packed in an integer whose
+    most significant a_len bits are Alice's and the remaining b_len are Bob's.
+
+    If samples is None every possible input is returned. Otherwise the
+    boundary inputs (all zeros, all ones and the ones propagating a carry
+    through the whole adder) are returned along with random inputs, for a
+    total of at most samples vectors.
+    """
+    total_wires = a_len + b_len
+    if samples is None or samples >= 1 << total_wires:
+        return range(1 << total_wires)
+
+    a_ones = (1 << a_len) - 1
+    boundary = {
+        0,
+        (1 << total_wires) - 1,
+        # Input carry and all of Alice's bits set, Bob's bits unset
+        a_ones << b_len,
+        # Alice's bits set except the input carry, Bob's lowest bit set
+        ((a_ones >> 1) << b_len) | (1 << max(b_len - 1, 0)),
+    }
+    vectors = set(sorted(boundary)[:samples])
+    # At most len(vectors) of the samples are boundary inputs, so there
+    # are enough of them to fill the remaining slots
+    for n in random.sample(range(1 << total_wires), samples):
+        if len(vectors) == samples:
+            break
+        vectors.add(n)
+
+    return sorted(vectors)
+
+
 def verifyResults(first_input, second_input):
     """
     Equality check performed on the two paramenters. This function
@@ -166,11 +386,18 @@ def verifyResults(first_input, second_input):
 def main(
     party,
     circuit_path,
+    samples=None,
+    jobs=None,
+    verbose=False,
 ):
     logging.getLogger().setLevel(logging.CRITICAL)
 
     if party == "local":
-        local = LocalTest(circuit_path, print_mode="circuit")
+        local = LocalTest(circuit_path,
+                          print_mode="circuit",
+                          samples=samples,
+                          jobs=jobs,
+                          verbose=verbose)
         local.start()
     else:
         logging.error(f"Unknown party '{party}'")
@@ -179,6 +406,14 @@ def main(
 if __name__ == '__main__':
     import argparse
 
+    def positive_int(value):
+        """argparse type accepting integers greater than 0."""
+        number = int(value)
+        if number < 1:
+            raise argparse.ArgumentTypeError(
+                f"{value} is not a positive integer")
+        return number
+
     def init():
         print('Started running Yao Protocol...\n')
 
@@ -203,9 +438,46 @@ if __name__ == '__main__':
             help=("the JSON circuit file for alice and local tests"),
         )
 
+        parser.add_argument(
+            "-s",
+            "--samples",
+            metavar="K",
+            type=positive_int,
+            default=64,
+            help=("the number of test vectors evaluated for each circuit"),
+        )
+
+        parser.add_argument(
+            "--exhaustive",
+            action="store_true",
+            help=("evaluate every possible input instead of a sample"),
+        )
+
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            metavar="N",
+            type=positive_int,
+            default=None,
+            help=("the number of worker processes "
+                  "(defaults to the CPU count)"),
+        )
+
+        parser.add_argument(
+            "-v",
+            "--verbose",
+            action="store_true",
+            help=("print every evaluation instead of the mismatches only"),
+        )
+
+        args = parser.parse_args()
+
         main(
-            party=parser.parse_args().party,
-            circuit_path=parser.parse_args().circuit,
+            party=args.party,
+            circuit_path=args.circuit,
+            samples=None if args.exhaustive else args.samples,
+            jobs=args.jobs,
+            verbose=args.verbose,
         )
 
     init()
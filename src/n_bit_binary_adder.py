@@ -1,38 +1,86 @@
-from binary_adder import *
+# Number of input pairs added at once by add_n_bits_sliced, keeping the
+# packed integers within a machine word
+SLICE_WIDTH = 64
 
 
 def add_n_bits(alice_input, bob_input, bits_per_party=4):
     """
-    Computes the sum of two n-bit inputs using concatenated 1bit full adders.
+    Computes the sum of two n-bit inputs with a single integer addition,
+    which is equivalent to concatenating n 1bit full adders.
     It returns the result of the sum with the carry appended.
 
+    This is the reference adder for a single pair of inputs, kept as a
+    public helper: the local tests use add_n_bits_sliced, which computes
+    the same results for many pairs at once.
+
     Input example:
-        alice_input = "11101" (1 initial carry, 4 bits representing the number)
-        bob_input = "0011" (4 bits representing the number)
+        alice_input = [1, 1, 1, 0, 1] (1 initial carry, 4 bits representing
+            the number, least significant bit first)
+        bob_input = [0, 0, 1, 1] (4 bits representing the number)
         bits_per_party = 4
     Output example: "00011" (4 bits representing the sum, 1 final carry)
     """
-    sum_result = ''
-
     alice_carry, *alice_input_number = alice_input
 
-    # Temporary carry used for subsequent 1bit full adder circuits
-    temp_carry = alice_carry
+    # Pack both inputs in integers, the i-th bit having weight 2**i
+    alice_number = sum(bit << i for i, bit in enumerate(alice_input_number))
+    bob_number = sum(bit << i for i, bit in enumerate(bob_input))
 
-    for i in range(bits_per_party):
-        current_bit_alice = alice_input_number[i]
-        current_bit_bob = bob_input[i]
+    total = alice_number + bob_number + int(alice_carry)
+
+    # The sum is padded to bits_per_party + 1 bits (the last one being
+    # the final carry) and reversed to have the least significant bit first
+    return format(total, '0{}b'.format(bits_per_party + 1))[::-1]
+
+
+def add_n_bits_sliced(alice_inputs, bob_inputs, bits_per_party=4):
+    """
+    Computes the sums of many pairs of n-bit inputs with bitwise 1bit full
+    adders. The pairs are processed in blocks of SLICE_WIDTH: bit i of
+    every input of a block is packed in an integer (the k-th bit of which
+    belongs to the k-th pair), so each full adder works on the whole block
+    with a few bitwise operations.
+
+    Input example:
+        alice_inputs = [[1, 1, 1, 0, 1], [0, 1, 0, 0, 0]] (same shape as
+            the alice_input argument of add_n_bits)
+        bob_inputs = [[0, 0, 1, 1], [1, 0, 0, 0]]
+        bits_per_party = 4
+    Output example: ["00011", "01000"]
+    """
+    results = []
+    for start in range(0, len(alice_inputs), SLICE_WIDTH):
+        results.extend(_add_n_bits_slice(
+            alice_inputs[start:start + SLICE_WIDTH],
+            bob_inputs[start:start + SLICE_WIDTH],
+            bits_per_party))
+
+    return results
 
-        # full_adder arguments:
-        #   - current carry
-        #   - alice's i-th input bit
-        #   - bob's i-th input bit
-        partial_carry, partial_sum = full_adder(
-            temp_carry, current_bit_alice, current_bit_bob)
 
-        sum_result += str(partial_sum)
+def _add_n_bits_slice(alice_inputs, bob_inputs, bits_per_party):
+    """
+    Computes the sums of at most SLICE_WIDTH pairs of n-bit inputs, see
+    add_n_bits_sliced.
+    """
+    def pack(inputs, i):
+        return sum(bits[i] << k for k, bits in enumerate(inputs))
+
+    # Alice's first bit is the input carry
+    carry = pack(alice_inputs, 0)
+    sums = []
+
+    for i in range(bits_per_party):
+        alice_bits = pack(alice_inputs, i + 1)
+        bob_bits = pack(bob_inputs, i)
+
+        partial = alice_bits ^ bob_bits
+        sums.append(partial ^ carry)
+        carry = (alice_bits & bob_bits) | (carry & partial)
 
-        # Carry stored for the next concatenated 1bit full adder
-        temp_carry = partial_carry
+    sums.append(carry)
 
-    return str(sum_result) + str(temp_carry)
+    # The k-th result is made of the k-th bit of each sum, 48 + bit being
+    # the ASCII code of the digit
+    return [bytes([48 + ((bits >> k) & 1) for bits in sums]).decode('ascii')
+            for k in range(len(alice_inputs))]
@@ -1,6 +1,7 @@
 # Taken from https://github.com/ojroques/garbled-circuit
 import pickle
 import random
+from collections import ChainMap
 from cryptography.fernet import Fernet
 
 
@@ -45,14 +46,37 @@ def evaluate(circuit, g_tables, pbits_out, a_inputs, b_inputs):
     Returns:
         A dict mapping output wires with their result bit.
     """
-    gates = circuit["gates"]  # dict containing circuit gates
-    wire_outputs = circuit["out"]  # list of output wires
     wire_inputs = {}  # dict containing Alice and Bob inputs
-    evaluation = {}  # dict containing result of evaluation
 
     wire_inputs.update(a_inputs)
     wire_inputs.update(b_inputs)
 
+    return evaluate_wires(circuit, g_tables, pbits_out, wire_inputs)
+
+
+def evaluate_wires(circuit, g_tables, pbits_out, wire_inputs):
+    """Evaluate yao circuit with the inputs of both Alice and Bob.
+
+    Unlike evaluate, the given mapping is not copied nor modified: gate
+    outputs are stored in a new dict for each call, so the caller can reuse
+    the mapping (and its values) across evaluations.
+
+    Args:
+        circuit: A dict containing circuit spec.
+        g_tables: The yao circuit garbled tables.
+        pbits_out: The pbits of outputs.
+        wire_inputs: A dict mapping Alice's and Bob's wires to
+            (key, encr_bit) inputs.
+
+    Returns:
+        A dict mapping output wires with their result bit.
+    """
+    gates = circuit["gates"]  # dict containing circuit gates
+    wire_outputs = circuit["out"]  # list of output wires
+    evaluation = {}  # dict containing result of evaluation
+    # Gate outputs are looked up first and written to the new dict
+    wire_inputs = ChainMap({}, wire_inputs)
+
     # Iterate over all gates
     for gate in sorted(gates, key=lambda g: g["id"]):
         gate_id, gate_in, msg = gate["id"], gate["in"], None